@@ -4,9 +4,17 @@ import matplotlib.pyplot as plt
 import numpy as np
 import scipy as sp
 import scipy.stats
+import scipy.special
 from math import sqrt, log
 import tqdm
 import random
+import time
+import json
+import os
+from functools import partial
+from confidence import bootstrap_bands, RegretMoments
+from scenarios import Scenario
+from transposition import canonical_state
 
 
 matplotlib.rcParams['ps.useafm'] = True
@@ -24,7 +32,70 @@ def bernoulli(p):
 ## Evaluation method
 
 
-def evaluate(method, horizon, runs):
+def simulate(m, pA, pB, horizon):
+    """
+    Simulates a single run of the method m on arms with probabilities pA and pB
+    
+    Returns
+    -------
+    losses : ndarray
+        Expected regret in each step
+    arms : ndarray
+        Arm chosen in each step
+    outcomes : ndarray
+        Observed outcome in each step
+    """
+    maxp = max(pA, pB)
+    losses = -np.ones(horizon);
+    arms = np.zeros(horizon, dtype=np.uint8)
+    outcomes = np.zeros(horizon, dtype=np.uint8)
+    for t in range(horizon):
+        arm = m.choose(t + 1)
+        if arm == 0:
+            p = bernoulli(pA)
+        else:
+            p = bernoulli(pB)
+        # update the algorithm
+        m.update(arm, p)
+        # update the regret (using the expected regret)
+        losses[t] = (maxp - (pA if arm == 0 else pB))
+        arms[t] = arm
+        outcomes[t] = p
+    return losses, arms, outcomes
+
+
+def simulate_scenario(m, scenario, horizon):
+    """
+    Simulates a single run of the method m on arms whose probabilities change
+    in every step as generated by the scenario (see scenarios.py). The regret 
+    is computed with respect to the best arm in each step.
+    
+    Returns
+    -------
+    losses, arms, outcomes : the same as simulate
+    """
+    losses = -np.ones(horizon);
+    arms = np.zeros(horizon, dtype=np.uint8)
+    outcomes = np.zeros(horizon, dtype=np.uint8)
+    t = 0
+    for probabilities in scenario.stream(horizon):
+        for pA, pB in probabilities.tolist():
+            arm = m.choose(t + 1)
+            if arm == 0:
+                p = bernoulli(pA)
+            else:
+                p = bernoulli(pB)
+            # update the algorithm
+            m.update(arm, p)
+            # update the regret (using the expected regret)
+            losses[t] = (max(pA, pB) - (pA if arm == 0 else pB))
+            arms[t] = arm
+            outcomes[t] = p
+            t += 1
+    return losses, arms, outcomes
+
+
+def evaluate(method, horizon, runs, trace=None, progress=None, progress_interval=60.0):
     """
     Evaluates the multi-armed bandit method
     
@@ -39,7 +110,21 @@ def evaluate(method, horizon, runs):
         If it is an integer, then bandits are generated randomply according to 
         the uniform beta distribution.
         If it is a list of tuples, then each item is treated as a configuration
-        for the two arms.
+        for the two arms. Items may also be scenarios (see scenarios.py) whose
+        probabilities change in every step.
+    trace : traces.TraceWriter, optional
+        When provided, the arms and outcomes of every run are recorded. Each run
+        then reseeds `random` and `np.random` with a recorded seed so that it
+        can be replayed exactly (see traces.replay_run).
+    progress : callable or str, optional
+        Receives partial results every progress_interval seconds and at the end:
+        a dictionary with the runs completed so far, the total number of runs, 
+        the elapsed time, the throughput (runs per second), and the per-step 
+        mean and standard error of the cumulative regrets. If it is a string,
+        the dictionary is written to a json file with this name instead 
+        (see read_progress and plot_progress).
+    progress_interval : float
+        Seconds between the progress reports
         
     Returns
     -------
@@ -54,32 +139,99 @@ def evaluate(method, horizon, runs):
 
     regrets = - np.ones((len(runs), horizon))
 
+    if progress is not None:
+        moments = RegretMoments(horizon)
+        start = last_report = time.time()
+        if isinstance(progress, str):
+            progress = partial(write_json, progress)
+
     for irun, run in enumerate(tqdm.tqdm(runs)):
         # generate problem 
+        scenario = None
         if run is None:
             pA = np.random.beta(1, 1);
             pB = np.random.beta(1, 1);
+        elif isinstance(run, Scenario):
+            if trace is not None:
+                raise ValueError("Traces are not supported for scenarios")
+            scenario = run
         else:
             pA, pB = run
-        maxp = max(pA, pB)
-        # initialize
-        losses = -np.ones(horizon);
+        if trace is not None:
+            seed = trace.new_seed()
+            random.seed(seed)
+            np.random.seed(seed)
         m = method()
+        # let the method load only the part of its tables that the horizon reaches
+        if hasattr(m, 'reserve'):
+            m.reserve(horizon)
         # simulate
-        for t in range(horizon):
-            arm = m.choose(t + 1)
-            if arm == 0:
-                p = bernoulli(pA)
-            else:
-                p = bernoulli(pB)
-            # update the algorithm
-            m.update(arm, p)
-            # update the regret (using the expected regret)
-            losses[t] = (maxp - (pA if arm == 0 else pB))
+        if scenario is None:
+            losses, arms, outcomes = simulate(m, pA, pB, horizon)
+        else:
+            losses, arms, outcomes = simulate_scenario(m, scenario, horizon)
+        if trace is not None:
+            trace.record(arms, outcomes, pA, pB, seed)
         regrets[irun, :] = np.cumsum(losses)
+        # publish the partial aggregates
+        if progress is not None and (time.time() - last_report >= progress_interval or irun + 1 == len(runs)):
+            moments.add(regrets[moments.count:irun + 1])
+            last_report = time.time()
+            progress({'runs': moments.count, 'total': len(runs), 'elapsed': last_report - start,
+                      'throughput': moments.count / max(last_report - start, 1e-9),
+                      'mean': moments.mean.tolist(), 'stderr': moments.stderr().tolist()})
     return regrets        
     
     
+def evaluate_exact(method, horizon, runs):
+    """
+    Computes the expected regret of a randomized method exactly by propagating 
+    the probabilities of all belief states instead of sampling. The number of 
+    states grows with the cube of the time step, so this is practical only 
+    for short horizons.
+    
+    Parameters
+    ----------
+    method : class or constructor
+        A class with the method probability(state, t) which returns the probability 
+        of choosing arm A in the state (Acountpos, Acountneg, Bcountpos, Bcountneg)
+        at the time step t (1-based, the same as in choose)
+    horizon : int
+        Horizon length
+    runs : list of tuples
+        Configurations (pA, pB) of the two arms
+        
+    Returns
+    -------
+    out : ndarray, matrix
+        Each row is a configuration and the entries are the expected cumulative 
+        regrets up to that point
+    """
+    m = method()
+    regrets = - np.ones((len(runs), horizon))
+    for irun, (pA, pB) in enumerate(runs):
+        maxp = max(pA, pB)
+        losses = -np.ones(horizon)
+        states = {(1, 1, 1, 1): 1.0}
+        for t in range(horizon):
+            loss = 0.0
+            nextstates = {}
+            for state, prob in states.items():
+                probA = m.probability(state, t + 1) * prob
+                probB = prob - probA
+                loss += probA * (maxp - pA) + probB * (maxp - pB)
+                for nextstate, nextprob in (((state[0]+1, state[1], state[2], state[3]), probA * pA),
+                                            ((state[0], state[1]+1, state[2], state[3]), probA * (1 - pA)),
+                                            ((state[0], state[1], state[2]+1, state[3]), probB * pB),
+                                            ((state[0], state[1], state[2], state[3]+1), probB * (1 - pB))):
+                    if nextprob > 0:
+                        nextstates[nextstate] = nextstates.get(nextstate, 0.0) + nextprob
+            losses[t] = loss
+            states = nextstates
+        regrets[irun, :] = np.cumsum(losses)
+    return regrets
+    
+    
 ## Standard methods            
 
 class UCB:
@@ -127,19 +279,27 @@ class UCB:
 class Thompson:
     """
     Thompson sampling
+    
+    sampler : betasampling.BetaTable, optional
+        Tables used to sample the posteriors instead of np.random.beta
     """
 
-    def __init__(self):
+    def __init__(self, sampler=None):
         # initialize prior values
         self.Acountpos = 1
         self.Acountneg = 1
         self.Bcountpos = 1
         self.Bcountneg = 1
+        self.sampler = sampler
 
     def choose(self, t):
         """ Which arm to choose; t is the current time step. Returns arm index """
-        pA = np.random.beta(self.Acountpos, self.Acountneg)
-        pB = np.random.beta(self.Bcountpos, self.Bcountneg)
+        if self.sampler is None:
+            pA = np.random.beta(self.Acountpos, self.Acountneg)
+            pB = np.random.beta(self.Bcountpos, self.Bcountneg)
+        else:
+            pA = self.sampler.draw(self.Acountpos, self.Acountneg)
+            pB = self.sampler.draw(self.Bcountpos, self.Bcountneg)
         if pA > pB:
             return 0
         else:
@@ -160,6 +320,79 @@ class Thompson:
         else:
             raise RuntimeError("Invalid arm number")    
             
+## Thompson sampling with exact decision probabilities
+
+# probabilities of choosing arm A, keyed by the canonical state (to avoid recomputation in every run)
+thompson_probabilities = {}
+
+def thompson_probability(Acountpos, Acountneg, Bcountpos, Bcountneg):
+    """
+    Probability that a sample from Beta(Acountpos, Acountneg) exceeds a sample 
+    from Beta(Bcountpos, Bcountneg), that is the probability that Thompson 
+    sampling chooses arm A. The finite sum for integer parameters runs over 
+    the smaller of the two positive counts.
+    """
+    # only the canonical states are stored; the mirrored probability is the complement
+    state, swapped = canonical_state((Acountpos, Acountneg, Bcountpos, Bcountneg))
+    if state in thompson_probabilities:
+        p = thompson_probabilities[state]
+        return 1.0 - p if swapped else p
+    Acountpos, Acountneg, Bcountpos, Bcountneg = state
+    # P(X > Y) for X ~ Beta(a1, b1), Y ~ Beta(a2, b2) is 1 - sum_{i < a2} ...
+    if Bcountpos <= Acountpos:
+        a1, b1, a2, b2, flip = Acountpos, Acountneg, Bcountpos, Bcountneg, False
+    else:
+        a1, b1, a2, b2, flip = Bcountpos, Bcountneg, Acountpos, Acountneg, True
+    i = np.arange(a2)
+    terms = sp.special.betaln(a1 + i, b1 + b2) - np.log(b2 + i) - \
+            sp.special.betaln(1 + i, b2) - sp.special.betaln(a1, b1)
+    p = 1.0 - min(1.0, np.exp(terms).sum())
+    p = 1.0 - p if flip else p
+    thompson_probabilities[state] = p
+    return 1.0 - p if swapped else p
+
+
+class ThompsonExact:
+    """
+    Thompson sampling that uses the exact probability of choosing each arm 
+    instead of sampling the posteriors. The decision takes a single uniform 
+    draw, and the probabilities can be used by evaluate_exact.
+    """
+
+    def __init__(self):
+        # initialize prior values
+        self.Acountpos = 1
+        self.Acountneg = 1
+        self.Bcountpos = 1
+        self.Bcountneg = 1
+
+    def probability(self, state, t):
+        """ Probability of choosing arm A in the state (Acountpos, Acountneg, Bcountpos, Bcountneg) """
+        return thompson_probability(*state)
+
+    def choose(self, t):
+        """ Which arm to choose; t is the current time step. Returns arm index """
+        state = (self.Acountpos, self.Acountneg, self.Bcountpos, self.Bcountneg)
+        if random.random() < self.probability(state, t):
+            return 0
+        else:
+            return 1
+
+    def update(self, arm, outcome):
+        """ Updates the estimate for the arm outcome """
+        if arm == 0:
+            if outcome == 1:
+                self.Acountpos += 1
+            else:
+                self.Acountneg += 1
+        elif arm == 1:
+            if outcome == 1:
+                self.Bcountpos += 1
+            else:
+                self.Bcountneg += 1
+        else:
+            raise RuntimeError("Invalid arm number")
+
 ## Gittins index
 
 # loads the index as a global variable (to avoid reinit in every run)
@@ -213,11 +446,26 @@ class Gittins:
 
 ## Plot confidence intervals
 
-def plot_confidence(data, *args, **kwargs):
-    """ 95% confidence interval"""
-    x = np.arange(data.shape[1])
-    mean = data.mean(0)
-    sigma = data.std(0) / np.sqrt(data.shape[0])
+def plot_confidence(data, *args, bootstrap=None, **kwargs):
+    """ 
+    95% confidence interval
+    
+    bootstrap : None, 'percentile', or 'bca'
+        None uses the normal approximation, otherwise the band is computed 
+        by confidence.bootstrap_bands with the given method
+    """
+    if bootstrap is None:
+        mean = data.mean(0)
+        sigma = data.std(0) / np.sqrt(data.shape[0])
+        lower, upper = mean - 1.96 * sigma, mean + 1.96 * sigma
+    else:
+        mean, lower, upper = bootstrap_bands(data, 0.95, bootstrap)
+    _plot_band(mean, lower, upper, *args, **kwargs)
+
+
+def _plot_band(mean, lower, upper, *args, **kwargs):
+    """ Plots the mean with a shaded band between lower and upper """
+    x = np.arange(mean.shape[0])
     
     z = plt.plot(x,mean, *args, **kwargs)
     # make sure that the color is consistent
@@ -226,8 +474,34 @@ def plot_confidence(data, *args, **kwargs):
     if 'label' in kwargs:
         del kwargs['label']
     plt.fill(np.concatenate([x, x[::-1]]),
-            np.concatenate([mean - 1.96 * sigma,
-                        (mean + 1.96 * sigma)[::-1]]),alpha=0.3, *args, **kwargs)
+            np.concatenate([lower, upper[::-1]]),alpha=0.3, *args, **kwargs)
+
+## Progress of long evaluations
+
+def write_json(filename, content):
+    """ Writes a json file atomically, so that readers never see a partial file """
+    temporary = filename + '.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(content, f)
+    os.replace(temporary, filename)
+
+
+def read_progress(filename):
+    """ Reads the progress written by evaluate; mean and stderr are returned as arrays """
+    with open(filename) as f:
+        status = json.load(f)
+    status['mean'] = np.array(status['mean'])
+    status['stderr'] = np.array(status['stderr'])
+    return status
+
+
+def plot_progress(filename, *args, **kwargs):
+    """ Plots the partial mean regret with a 95% confidence interval from a progress file """
+    status = read_progress(filename)
+    mean, sigma = status['mean'], status['stderr']
+    _plot_band(mean, mean - 1.96 * sigma, mean + 1.96 * sigma, *args, **kwargs)
+    plt.title('%d of %d runs (%.1f runs/s)' % (status['runs'], status['total'], status['throughput']))
+    return status
 
 #plot_confidence(ucb_regrets, '-', label='UCB')
 #plt.legend()
@@ -0,0 +1,213 @@
+"""
+Fast sampling from Beta distributions with integer parameters
+
+The inverse CDF of every Beta(alpha, beta) with alpha + beta <= max_sum is tabulated
+on a uniform grid of `resolution` + 1 quantiles. A sample is drawn from a single uniform
+number by linear interpolation between the two neighbouring quantiles. The samples
+fall in each of the `resolution` quantile intervals with exactly the right probability,
+so the sampled CDF agrees with the true one at the grid and the two differ only inside
+the intervals.
+
+The quantile function is steep in the first and the last interval (for Beta(1, 290) it
+rises from q(1 - 1/resolution) = 0.019 to q(1) = 1), where a linear interpolation would
+spread a thin tail uniformly over a wide range. Each of the two intervals is therefore
+tabulated again on a finer grid of `resolution` subintervals, and the uniform numbers that
+fall in the outermost subintervals, 2 / resolution**2 of all, are inverted exactly.
+
+The table rows are computed when a pair is first used.
+"""
+
+import numpy as np
+import random
+import scipy.special
+import scipy.stats
+
+class BetaTable:
+    """
+    Inverse-CDF tables for Beta(alpha, beta) with integer alpha, beta >= 1
+    and alpha + beta <= max_sum. Other parameters fall back to np.random.beta.
+
+    Parameters
+    ----------
+    max_sum : int
+        Largest alpha + beta; a policy with the uniform prior that runs for horizon
+        steps needs horizon + 2 (+ 1 when it looks one step ahead)
+    resolution : int
+        Number of quantile intervals; also the number of subintervals of the two end intervals
+    """
+
+    def __init__(self, max_sum, resolution=256):
+        self.max_sum = max_sum
+        self.resolution = resolution
+        # the main grid followed by the finer grids of the first and the last interval
+        self.grid = np.concatenate([np.linspace(0, 1, resolution + 1),
+                                    np.linspace(0, 1 / resolution, resolution + 1),
+                                    np.linspace(1 - 1 / resolution, 1, resolution + 1)])
+        self.width = self.grid.size
+        pairs = (max_sum - 1) * max_sum // 2
+        # np.empty does not touch the memory of the rows that are never computed
+        self.table = np.empty((pairs, self.width), dtype=np.float32)
+        self.flat = self.table.reshape(-1)
+        self.filled = np.zeros(pairs, dtype=bool)
+        # (alpha, beta) -> (row index, row) for the computed rows, used with scalar parameters
+        self.rows = {}
+
+    def _inside(self, alpha, beta):
+        """ Whether the parameters (scalars or arrays) are in the table """
+        return ((alpha >= 1) & (beta >= 1) & (alpha + beta <= self.max_sum) &
+                (alpha == np.floor(alpha)) & (beta == np.floor(beta)))
+
+    def _rows(self, alpha, beta):
+        """ Indexes of the rows of the pairs (arrays); computes the missing ones """
+        total = alpha + beta
+        rows = (total - 2) * (total - 1) // 2 + alpha - 1
+        if self.filled[rows].all():
+            return rows
+        missing = np.unique(rows[~self.filled[rows]])
+        if missing.size > 0:
+            # invert the row index: total - 2 = level of the triangle
+            level = np.floor((np.sqrt(8 * missing + 1) - 1) / 2).astype(int)
+            a = missing - level * (level + 1) // 2 + 1
+            b = level + 2 - a
+            self.table[missing] = scipy.special.betaincinv(a[:, np.newaxis], b[:, np.newaxis],
+                                                           self.grid[np.newaxis, :])
+            self.filled[missing] = True
+        return rows
+
+    def sample(self, alpha, beta, size=None):
+        """
+        Draws samples for many (alpha, beta) pairs at once
+
+        Parameters
+        ----------
+        alpha, beta : float or array of floats
+            Parameters; they are broadcast together with size. Only integer
+            parameters are tabulated, others are sampled with np.random.beta.
+        size : int or tuple, optional
+            Output shape, as in np.random.beta
+
+        Returns
+        -------
+        out : ndarray (or float when all arguments are scalar)
+        """
+        if np.ndim(alpha) == 0 and np.ndim(beta) == 0:
+            if not self._inside(alpha, beta):
+                return np.random.beta(alpha, beta, size)
+            if size is None:
+                return self.draw(int(alpha), int(beta))
+            return self._interpolate(self._row(int(alpha), int(beta))[0], size, alpha, beta)
+        alpha, beta = np.broadcast_arrays(np.asarray(alpha), np.asarray(beta))
+        shape = alpha.shape if size is None else size
+        inside = self._inside(alpha, beta)
+        if inside.all():
+            # the rows are found before broadcasting, usually for far fewer pairs than samples
+            rows = self._rows(alpha.astype(int), beta.astype(int))
+            return self._interpolate(np.broadcast_to(rows, shape), shape, alpha, beta)
+        alpha = np.broadcast_to(alpha, shape)
+        beta = np.broadcast_to(beta, shape)
+        inside = np.broadcast_to(inside, shape)
+        out = np.empty(shape)
+        rows = self._rows(alpha[inside].astype(int), beta[inside].astype(int))
+        out[inside] = self._interpolate(rows, rows.shape, alpha[inside], beta[inside])
+        out[~inside] = np.random.beta(alpha[~inside], beta[~inside])
+        return out
+
+    def _interpolate(self, rows, shape, alpha, beta):
+        """
+        Samples of the given shape from the rows (an array of the shape or a single row);
+        alpha and beta are the parameters of the rows
+        """
+        resolution = self.resolution
+        # flat arrays; indexing them is faster
+        u = np.random.random_sample(shape).reshape(-1) * resolution
+        index = u.astype(np.intp)
+        position = u - index
+        cells = (rows * self.width).reshape(-1) + index
+        # the end intervals are interpolated on their finer grids
+        ends = np.flatnonzero((index == 0) | (index == resolution - 1))
+        if ends.size > 0:
+            fine = position[ends] * resolution
+            subindex = fine.astype(np.intp)
+            first = index[ends] == 0
+            # the finer grids follow the main one in the row
+            cells[ends] += np.where(first, resolution + 1, 2 * resolution + 2) - index[ends] + subindex
+            position[ends] = fine - subindex
+        lower = self.flat[cells]
+        out = lower + (self.flat[cells + 1] - lower) * position
+        if ends.size > 0:
+            # the outermost subintervals are inverted exactly
+            exact = ends[np.where(first, subindex == 0, subindex == resolution - 1)]
+            if exact.size > 0:
+                out[exact] = scipy.special.betaincinv(np.broadcast_to(alpha, shape).reshape(-1)[exact],
+                                                      np.broadcast_to(beta, shape).reshape(-1)[exact],
+                                                      u[exact] / resolution)
+        return out.reshape(shape)
+
+    def _row(self, alpha, beta):
+        """ Index and values of the row of a single pair """
+        entry = self.rows.get((alpha, beta))
+        if entry is None:
+            row = self._rows(np.array([alpha]), np.array([beta]))[0]
+            entry = self.rows[(alpha, beta)] = (row, self.table[row])
+        return entry
+
+    def draw(self, alpha, beta):
+        """ Draws a single sample; faster than sample for scalar parameters """
+        entry = self.rows.get((alpha, beta))
+        if entry is None:
+            if not self._inside(alpha, beta):
+                return np.random.beta(alpha, beta)
+            entry = self._row(alpha, beta)
+        values = entry[1]
+        resolution = self.resolution
+        u = random.random() * resolution
+        index = int(u)
+        position = u - index
+        if index == 0 or index == resolution - 1:
+            fine = position * resolution
+            subindex = int(fine)
+            if (index == 0 and subindex == 0) or (index > 0 and subindex == resolution - 1):
+                return float(scipy.special.betaincinv(alpha, beta, u / resolution))
+            index = (resolution + 1 if index == 0 else 2 * resolution + 2) + subindex
+            position = fine - subindex
+        lower = float(values[index])
+        return lower + (float(values[index + 1]) - lower) * position
+
+
+def compare_with_numpy(sampler, pairs, samples=100000, tail=0.001):
+    """
+    Compares the sampler with np.random.beta and with the exact distribution
+
+    The Kolmogorov-Smirnov statistic stays below about 1 / resolution whenever the samples
+    fall in the quantile intervals with the right probability, whatever their distribution
+    inside the intervals, so the mean and the tails are checked as well.
+
+    Parameters
+    ----------
+    sampler : BetaTable
+    pairs : list of (alpha, beta)
+    samples : int
+        Number of samples from each source for each pair
+    tail : float
+        Probability of the checked tails
+
+    Returns
+    -------
+    out : list of dicts with
+        alpha, beta : parameters
+        ks, pvalue : two-sample Kolmogorov-Smirnov test against np.random.beta
+        mean_z : difference between the mean of the samples and the exact mean,
+                 in standard errors
+        lower, upper : fractions of the samples below the tail quantile and above
+                       the 1 - tail quantile; both should be close to tail
+    """
+    results = []
+    for alpha, beta in pairs:
+        drawn = sampler.sample(alpha, beta, size=samples)
+        test = scipy.stats.ks_2samp(drawn, np.random.beta(alpha, beta, size=samples))
+        mean, variance = scipy.stats.beta.stats(alpha, beta, moments='mv')
+        low, high = scipy.special.betaincinv(alpha, beta, [tail, 1 - tail])
+        results.append({'alpha': alpha, 'beta': beta, 'ks': test.statistic, 'pvalue': test.pvalue,
+                        'mean_z': (drawn.mean() - mean) / np.sqrt(variance / samples),
+                        'lower': np.mean(drawn < low), 'upper': np.mean(drawn > high)})
+    return results
@@ -5,17 +5,14 @@ from basics import *
 ## Lookead value function
 
 
-import pandas as pa
+from valuetables import ValueTable
+from betasampling import BetaTable
+from transposition import TranspositionCache
+from lookahead import ValueFunctionLookahead
 
-ucb_valuefunction = {}
-valuefunction_csv = pa.read_csv('valuecomputation/ucb_value.csv')
-for (t, p, n, v) in zip(valuefunction_csv.Time, valuefunction_csv.Positive, valuefunction_csv.Negative, valuefunction_csv.Value):
-    ucb_valuefunction[(t,p,n)] = v
-
-gittins_valuefunction = {}
-valuefunction_csv = pa.read_csv('valuecomputation/gittins_value.csv')
-for (t, p, n, v) in zip(valuefunction_csv.Time, valuefunction_csv.Positive, valuefunction_csv.Negative, valuefunction_csv.Value):
-    gittins_valuefunction[(t,p,n)] = v
+# the time steps are loaded only as far as the experiments reach
+ucb_valuefunction = ValueTable.open('valuecomputation/ucb_value.csv')
+gittins_valuefunction = ValueTable.open('valuecomputation/gittins_value.csv')
 
 
 class ValueFunction:
@@ -63,72 +60,9 @@ class ValueFunction:
         elif qvalueA < qvalueB:     return 1
         else:                       return bernoulli(0.5)
 
-    def update(self, arm, outcome):
-        """ Updates the estimate for the arm outcome """
-        if arm == 0:
-            if outcome == 1:    self.Acountpos += 1
-            else:               self.Acountneg += 1
-        elif arm == 1:
-            if outcome == 1:    self.Bcountpos += 1
-            else:               self.Bcountneg += 1
-        else: raise RuntimeError("Invalid arm number")
-
-
-class ValueFunctionLookahead:
-    """
-    Use multi-step lookahead with a *linearly separable* value function which
-    is precomputed for each arm separately
-    valuefunction : the value function to be used in the lookahead
-    """
-    def __init__(self, valuefunction, lookahead_hor = 1, scale = 1.0):
-        # initialize prior values
-        self.Acountpos = 1;self.Acountneg = 1;self.Bcountpos = 1;self.Bcountneg = 1;
-        self.lookahead_hor = lookahead_hor
-        self.valuefunction = valuefunction
-        self.cache = {}
-        self.scale = scale
-
-    def _lookahead(self, state, t, steps_left):
-        """ Recursive and dumb lookahead 
-            The order of elements in state is:
-                Acountpos, Acountneg, Bcountpos, Bcountneg 
-            Returns: action, value function
-        """
-        
-        # terminate if this is the last step
-        if steps_left == 0:
-            return -1, self.scale * (self.valuefunction[(t, state[0], state[1])] + \
-                                     self.valuefunction[(t, state[2], state[3])])
-
-        # the cache is specific only to the particular run
-        if state in self.cache:
-            return self.cache[state]
-        
-        # the pre-computed value function is 0-based! (t=0 is the first time-step)
-        vApos = self._lookahead((state[0]+1, state[1], state[2], state[3]), t+1, steps_left-1)[1]
-        vAneg = self._lookahead((state[0], state[1]+1, state[2], state[3]), t+1, steps_left-1)[1]
-        vBpos = self._lookahead((state[0], state[1], state[2]+1, state[3]), t+1, steps_left-1)[1]
-        vBneg = self._lookahead((state[0], state[1], state[2], state[3]+1), t+1, steps_left-1)[1]
-
-        pA = state[0] / (state[0] + state[1])
-        qvalueA = pA * (1 + vApos) + (1 - pA) * vAneg
-        
-        pB = state[2] / (state[2] + state[3])
-        qvalueB = pB * (1 + vBpos) + (1 - pB) * vBneg
-
-        if qvalueA > qvalueB:       r = 0, qvalueA
-        elif qvalueA < qvalueB:     r = 1, qvalueB
-        else:                       r = bernoulli(0.5), qvalueA
-        
-        # cache the result
-        self.cache[state] = r
-        return r
-
-    def choose(self, t):
-        """ Which arm to choose; t is the current time step. Returns arm index """
-        # change 1-based time to 0-based
-        self.cache.clear()
-        return self._lookahead((self.Acountpos, self.Acountneg, self.Bcountpos, self.Bcountneg), t-1, self.lookahead_hor)[0]
+    def reserve(self, horizon):
+        """ Loads the value function for the time steps that the horizon reaches """
+        self.valuefunction.reserve(horizon + 1)
 
     def update(self, arm, outcome):
         """ Updates the estimate for the arm outcome """
@@ -146,9 +80,13 @@ class ValueFunctionLookahead:
 horizon = 290
 trials = 2000
 
+# lookahead results shared by all runs with the same value function
+ucb_cache = TranspositionCache()
+gittins_cache = TranspositionCache()
+
 ucb_regrets = evaluate(lambda: UCB(2.0), horizon, trials)
-vf_ucb_regrets = evaluate(lambda: ValueFunctionLookahead(ucb_valuefunction, 2), horizon, trials)
-vf_gittins_regrets = evaluate(lambda: ValueFunctionLookahead(gittins_valuefunction,2), horizon, trials)
+vf_ucb_regrets = evaluate(lambda: ValueFunctionLookahead(ucb_valuefunction, 2, cache=ucb_cache), horizon, trials)
+vf_gittins_regrets = evaluate(lambda: ValueFunctionLookahead(gittins_valuefunction,2, cache=gittins_cache), horizon, trials)
 thompson_regrets = evaluate(Thompson, horizon, trials)
 gittins_regrets = evaluate(Gittins, horizon, trials)
 
@@ -180,9 +118,12 @@ runs = tuple(
     p1 != p2)
 deltas = np.array(tuple(abs(pA - pB) for pA, pB in runs))
 
+# posterior sampling tables shared by all runs
+beta_table = BetaTable(horizon + 3)
+
 ucb_regrets = evaluate(UCB, horizon, runs)
-thompson_regrets = evaluate(Thompson, horizon, runs)
-ola_regrets = evaluate(OptimisticLookAhead, horizon, runs)
+thompson_regrets = evaluate(lambda: Thompson(beta_table), horizon, runs)
+ola_regrets = evaluate(lambda: OptimisticLookAhead(beta_table), horizon, runs)
 gittins_regrets = evaluate(Gittins, horizon, runs)
 
 ## Plot dependence on delta
@@ -218,15 +159,19 @@ plt.show()
 class OptimisticLookAhead:
     """
     Optimistic Look Ahead inspired on OGI paper by Gutin & Farias
+    
+    sampler : betasampling.BetaTable, optional
+        Tables used to sample the posteriors instead of np.random.beta
     """
 
-    def __init__(self):
+    def __init__(self, sampler=None):
         # initialize prior values
         self.Acountpos = 1;
         self.Acountneg = 1;
         self.Bcountpos = 1;
         self.Bcountneg = 1;
         self.betasamplecount = 100
+        self.sampler = sampler
 
     def choose(self, t):
         """ Which arm to choose; t is the current time step. Returns arm index """
@@ -236,23 +181,14 @@ class OptimisticLookAhead:
         discount = 0.9 if self.betasamplecount>=100 else np.log2(self.betasamplecount)/10
         tRemain = (1 - discount ** tRemain) / (1 - discount)
 
-        v01 = np.mean(
-            np.max(np.row_stack((np.random.beta(self.Acountpos + 1, self.Acountneg, size=self.betasamplecount),
-                                 np.random.beta(self.Bcountpos, self.Bcountneg, size=self.betasamplecount))),
-                   axis=0)) * tRemain
-
-        v02 = np.mean(
-            np.max(np.row_stack((np.random.beta(self.Acountpos, self.Acountneg + 1, size=self.betasamplecount),
-                                 np.random.beta(self.Bcountpos, self.Bcountneg, size=self.betasamplecount))),
-                   axis=0)) * tRemain
-
-        v11 = np.mean(np.max(np.row_stack((np.random.beta(self.Acountpos, self.Acountneg, size=self.betasamplecount),
-                                           np.random.beta(self.Bcountpos + 1, self.Bcountneg,
-                                                          size=self.betasamplecount))), axis=0)) * tRemain
-
-        v12 = np.mean(np.max(np.row_stack((np.random.beta(self.Acountpos, self.Acountneg, size=self.betasamplecount),
-                                           np.random.beta(self.Bcountpos, self.Bcountneg + 1,
-                                                          size=self.betasamplecount))), axis=0)) * tRemain
+        # posteriors of arms A and B after each of the four outcomes, all sampled at once
+        alphas = np.array([self.Acountpos + 1, self.Bcountpos, self.Acountpos, self.Bcountpos,
+                           self.Acountpos, self.Bcountpos + 1, self.Acountpos, self.Bcountpos])
+        betas = np.array([self.Acountneg, self.Bcountneg, self.Acountneg + 1, self.Bcountneg,
+                          self.Acountneg, self.Bcountneg, self.Acountneg, self.Bcountneg + 1])
+        beta = np.random.beta if self.sampler is None else self.sampler.sample
+        samples = beta(alphas[:, np.newaxis], betas[:, np.newaxis], size=(8, self.betasamplecount))
+        v01, v02, v11, v12 = np.mean(np.max(samples.reshape(4, 2, -1), axis=1), axis=1) * tRemain
 
         pA = self.Acountpos / (self.Acountpos + self.Acountneg)
         valueA = pA * (1 + v01) + (1 - pA) * v02
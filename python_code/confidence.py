@@ -0,0 +1,172 @@
+"""
+Confidence bands for regret curves
+
+The bootstrap uses Poisson weights (each run is included Poisson(1) times in every
+replicate) instead of multinomial resampling. This makes the replicates independent
+across runs, so a regret matrix can be processed in blocks of rows, or streamed in
+chunks, and the memory is bounded by the number of replicates times the block size.
+"""
+
+import numpy as np
+import scipy.stats
+from concurrent.futures import ThreadPoolExecutor
+
+## Streaming aggregates
+
+class RegretMoments:
+    """
+    Per-step count, mean, and 2nd and 3rd central moment sums of regret runs.
+    Blocks of runs can be added in any order and aggregates can be merged.
+    """
+
+    def __init__(self, horizon):
+        self.count = 0
+        self.mean = np.zeros(horizon)
+        self.m2 = np.zeros(horizon)
+        self.m3 = np.zeros(horizon)
+
+    def add(self, block):
+        """ Adds a block of runs, one run per row """
+        block = np.atleast_2d(block)
+        other = RegretMoments(block.shape[1])
+        other.count = block.shape[0]
+        other.mean = block.mean(0)
+        centered = block - other.mean
+        other.m2 = (centered ** 2).sum(0)
+        other.m3 = (centered ** 3).sum(0)
+        self.merge(other)
+
+    def merge(self, other):
+        """ Adds the runs aggregated in other """
+        if other.count == 0:
+            return
+        na, nb = self.count, other.count
+        n = na + nb
+        delta = other.mean - self.mean
+        self.m3 = self.m3 + other.m3 + delta ** 3 * na * nb * (na - nb) / n ** 2 + \
+                    3 * delta * (na * other.m2 - nb * self.m2) / n
+        self.m2 = self.m2 + other.m2 + delta ** 2 * na * nb / n
+        self.mean = self.mean + delta * nb / n
+        self.count = n
+
+    def std(self):
+        """ Standard deviation (the same as data.std(0)) """
+        return np.sqrt(self.m2 / self.count)
+
+    def stderr(self):
+        """ Standard error of the mean """
+        return self.std() / np.sqrt(self.count)
+
+    def acceleration(self):
+        """ Jackknife acceleration of the mean used by the BCa bootstrap """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            a = self.m3 / (6 * self.m2 ** 1.5)
+        return np.nan_to_num(a)
+
+## Bootstrap
+
+def _weighted_sums(rng, data, replicates, memory):
+    """ Poisson-weighted sums of the rows of data and the total weights, processed in blocks """
+    sums = np.zeros((replicates, data.shape[1]))
+    weights = np.zeros(replicates)
+    rows = max(1, memory // (8 * replicates))
+    for start in range(0, data.shape[0], rows):
+        block = data[start:start + rows]
+        w = rng.poisson(1.0, size=(replicates, block.shape[0])).astype(np.float64)
+        sums += w @ block
+        weights += w.sum(1)
+    return sums, weights
+
+
+def bootstrap_bands(data, confidence=0.95, method='percentile', replicates=1000,
+                    workers=4, memory=2**26, seed=None):
+    """
+    Bootstrap confidence bands of the mean regret for every time step at once
+
+    Parameters
+    ----------
+    data : ndarray, iterable of ndarrays, or list of RegretMoments
+        Regret matrix with a run in each row, or a sequence of such matrices (for
+        example read from chunked result files). When given aggregates of chunks,
+        the chunks are resampled instead of runs; this is only valid when the runs
+        are assigned to chunks at random and each chunk holds many runs.
+    confidence : float
+        Coverage of the band
+    method : 'percentile' or 'bca'
+        Percentile or bias-corrected and accelerated bootstrap
+    replicates : int
+        Number of bootstrap replicates; replicates in which all the weights are
+        zero (likely only with very few runs or chunks) are dropped
+    workers : int
+        Number of threads; each computes a share of the replicates
+    memory : int
+        Approximate number of bytes of the weights held by each thread
+    seed : int, optional
+        Seed of the resampling; fresh entropy from the system when not given, so
+        that the state of np.random (and the seeded experiments that use it) is
+        not changed
+
+    Returns
+    -------
+    mean, lower, upper : ndarrays
+    """
+    if method not in ('percentile', 'bca'):
+        raise ValueError("Unknown bootstrap method: " + str(method))
+    if isinstance(data, np.ndarray):
+        data = (data,)
+    shares = np.array_split(np.arange(replicates), workers)
+    # without a seed, the sequence takes fresh entropy and np.random is left untouched
+    rngs = [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(workers)]
+
+    moments = None
+    with ThreadPoolExecutor(workers) as pool:
+        for chunk in data:
+            if isinstance(chunk, RegretMoments):
+                aggregate = chunk
+                # the chunk is a single unit; the last column accumulates the weighted run counts
+                units = np.append(chunk.mean * chunk.count, chunk.count)[np.newaxis, :]
+            else:
+                units = np.asarray(chunk, dtype=np.float64)
+                aggregate = RegretMoments(units.shape[1])
+                aggregate.add(units)
+            if moments is None:
+                moments = RegretMoments(aggregate.mean.size)
+                sums = np.zeros((replicates, aggregate.mean.size))
+                weights = np.zeros(replicates)
+            moments.merge(aggregate)
+
+            results = pool.map(lambda i: _weighted_sums(rngs[i], units, len(shares[i]), memory),
+                               range(workers))
+            for share, (s, w) in zip(shares, results):
+                if isinstance(chunk, RegretMoments):
+                    sums[share] += s[:, :-1]
+                    weights[share] += s[:, -1]
+                else:
+                    sums[share] += s
+                    weights[share] += w
+    if moments is None:
+        raise ValueError("No data to bootstrap")
+
+    # a replicate draws no unit at all with probability exp(-units); it has no mean
+    drawn = weights > 0
+    if not drawn.any():
+        raise ValueError("No bootstrap replicate drew any data")
+    means = sums[drawn] / weights[drawn][:, np.newaxis]
+    replicates = means.shape[0]
+    alpha = (1 - confidence) / 2
+    if method == 'percentile':
+        lower, upper = np.quantile(means, [alpha, 1 - alpha], axis=0)
+        return moments.mean, lower, upper
+
+    # BCa: bias correction from the replicates, acceleration from the moments
+    fraction = np.clip((means < moments.mean).mean(0), 0.5 / replicates, 1 - 0.5 / replicates)
+    z0 = scipy.stats.norm.ppf(fraction)
+    a = moments.acceleration()
+    means.sort(0)
+    bounds = []
+    for level in (alpha, 1 - alpha):
+        z = z0 + scipy.stats.norm.ppf(level)
+        q = scipy.stats.norm.cdf(z0 + z / (1 - a * z))
+        index = np.clip(np.round(q * (replicates - 1)).astype(int), 0, replicates - 1)
+        bounds.append(np.take_along_axis(means, index[np.newaxis, :], 0)[0])
+    return moments.mean, bounds[0], bounds[1]
@@ -0,0 +1,186 @@
+"""
+Distributed evaluation over a shared directory (for example an NFS mount)
+
+The runs of an experiment are split into work units that are stored as files:
+    sweep.json              : horizon and number of units
+    pending/<unit>.json     : units that wait for a worker
+    claimed/<unit>.<worker> : units being evaluated; the modification time is the lease
+    results/<unit>.npy      : regrets of finished units
+
+A worker claims a unit by renaming it from pending to claimed, which succeeds for
+exactly one worker. While evaluating, it keeps touching the claimed file; units
+whose lease expired (because the worker crashed) are renamed back to pending.
+Each unit seeds `random` and `np.random` with its own seed, so a re-evaluated unit
+produces the same regrets. The hosts' clocks must roughly agree with the lease.
+"""
+
+import json
+import multiprocessing
+import os
+import random
+import socket
+import threading
+import time
+import numpy as np
+
+from basics import evaluate, write_json
+
+## Submitting and merging
+
+def submit(directory, runs, horizon, unit_size=100, seed=None):
+    """
+    Splits the runs into work units in the shared directory
+
+    Parameters
+    ----------
+    runs : int, or list of tuples
+        The same as in evaluate
+    unit_size : int
+        Number of runs in each unit
+    seed : int, optional
+        Seed from which the unit seeds are derived; drawn from `random` when not given
+    """
+    if type(runs) == int:
+        runs = (None,) * runs
+    if seed is None:
+        seed = random.getrandbits(32)
+    for name in ('pending', 'claimed', 'results'):
+        os.makedirs(os.path.join(directory, name), exist_ok=True)
+    units = (len(runs) + unit_size - 1) // unit_size
+    for unit in range(units):
+        content = {'unit': unit, 'horizon': horizon, 'seed': (seed + unit) % 2**32,
+                   'runs': [None if run is None else list(run) for run in
+                            runs[unit * unit_size:(unit + 1) * unit_size]]}
+        write_json(os.path.join(directory, 'pending', '%08d.json' % unit), content)
+    write_json(os.path.join(directory, 'sweep.json'), {'horizon': horizon, 'units': units})
+
+
+def merge(directory):
+    """ Returns the regrets of all units in the order of the runs (the same as evaluate) """
+    with open(os.path.join(directory, 'sweep.json')) as f:
+        units = json.load(f)['units']
+    return np.vstack([np.load(_result_path(directory, unit)) for unit in range(units)])
+
+
+def _result_path(directory, unit):
+    return os.path.join(directory, 'results', '%08d.npy' % unit)
+
+## Workers
+
+def _reclaim(directory, lease):
+    """ Returns units with expired leases to pending; returns the number of claimed units left """
+    claimed = os.path.join(directory, 'claimed')
+    left = 0
+    for name in os.listdir(claimed):
+        path = os.path.join(claimed, name)
+        try:
+            if time.time() - os.path.getmtime(path) > lease:
+                os.rename(path, os.path.join(directory, 'pending', name.split('.')[0] + '.json'))
+            else:
+                left += 1
+        except FileNotFoundError:
+            # finished or reclaimed by someone else in the meantime
+            pass
+    return left
+
+
+def _claim(directory, worker):
+    """ Claims a pending unit; returns the path of the claimed file or None """
+    pending = os.path.join(directory, 'pending')
+    names = [name for name in os.listdir(pending) if name.endswith('.json')]
+    random.shuffle(names)
+    for name in names:
+        path = os.path.join(directory, 'claimed', name[:-len('.json')] + '.' + worker)
+        try:
+            os.rename(os.path.join(pending, name), path)
+            return path
+        except FileNotFoundError:
+            # claimed by another worker
+            continue
+    return None
+
+
+def _heartbeat(path, interval, stop):
+    """ Keeps renewing the lease until stopped """
+    while not stop.wait(interval):
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return
+
+
+def work(directory, method, lease=600.0, poll=5.0, worker=None):
+    """
+    Evaluates units from the shared directory until all of them are finished
+
+    Parameters
+    ----------
+    method : class or constructor
+        The same as in evaluate
+    lease : float
+        Seconds after which a unit whose claim was not renewed is evaluated again
+    poll : float
+        Seconds to wait when all remaining units are claimed by other workers
+    worker : str, optional
+        Name of the worker; host name and process id by default
+
+    Returns
+    -------
+    out : int
+        Number of units evaluated by this worker
+    """
+    if worker is None:
+        worker = '%s-%d' % (socket.gethostname(), os.getpid())
+    with open(os.path.join(directory, 'sweep.json')) as f:
+        units = json.load(f)['units']
+    evaluated = 0
+    while True:
+        path = _claim(directory, worker)
+        if path is None:
+            if _reclaim(directory, lease) > 0 or len(os.listdir(os.path.join(directory, 'pending'))) > 0:
+                time.sleep(poll)
+                continue
+            if all(os.path.exists(_result_path(directory, unit)) for unit in range(units)):
+                return evaluated
+            time.sleep(poll)
+            continue
+
+        with open(path) as f:
+            content = json.load(f)
+        result = _result_path(directory, content['unit'])
+        if not os.path.exists(result):
+            stop = threading.Event()
+            heartbeat = threading.Thread(target=_heartbeat, args=(path, lease / 4, stop), daemon=True)
+            heartbeat.start()
+            try:
+                random.seed(content['seed'])
+                np.random.seed(content['seed'])
+                runs = [None if run is None else tuple(run) for run in content['runs']]
+                regrets = evaluate(method, content['horizon'], runs)
+            finally:
+                stop.set()
+                heartbeat.join()
+            temporary = '%s.%s.npy' % (result[:-len('.npy')], worker)
+            np.save(temporary, regrets)
+            os.replace(temporary, result)
+            evaluated += 1
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # the lease expired and the unit was reclaimed; its result is the same
+            pass
+
+
+def run_local(directory, method, workers=4, lease=600.0, poll=1.0):
+    """
+    Runs workers as local processes on a submitted directory and waits for them.
+    Useful on a single host and to test a sweep before running it on a cluster.
+    """
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=work, args=(directory, method, lease, poll, 'local%d' % i))
+                 for i in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return merge(directory)
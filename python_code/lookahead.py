@@ -0,0 +1,97 @@
+"""
+Multi-step lookahead with precomputed value functions
+
+The policy is kept apart from the experiments in comparison.py so that it can be
+imported and tested without running them.
+"""
+
+import random
+from transposition import canonical_state
+
+class ValueFunctionLookahead:
+    """
+    Use multi-step lookahead with a *linearly separable* value function which
+    is precomputed for each arm separately
+    valuefunction : the value function to be used in the lookahead
+    cache : transposition cache shared by runs with the same value function 
+            and scale (see transposition.py); by default the cache is cleared
+            in every step
+    """
+    def __init__(self, valuefunction, lookahead_hor = 1, scale = 1.0, cache = None):
+        # initialize prior values
+        self.Acountpos = 1;self.Acountneg = 1;self.Bcountpos = 1;self.Bcountneg = 1;
+        self.lookahead_hor = lookahead_hor
+        self.valuefunction = valuefunction
+        self.shared = cache is not None
+        self.cache = {} if cache is None else cache
+        self.scale = scale
+
+    def _lookahead(self, state, t, steps_left):
+        """ Recursive and dumb lookahead 
+            The order of elements in state is:
+                Acountpos, Acountneg, Bcountpos, Bcountneg 
+            Returns: action (None when tied), value function
+        """
+        
+        # terminate if this is the last step
+        if steps_left == 0:
+            return -1, self.scale * (self.valuefunction[(t, state[0], state[1])] + \
+                                     self.valuefunction[(t, state[2], state[3])])
+
+        # the result depends only on the key and not on the run; mirrored
+        # states share the entry of the canonical state
+        state, swapped = canonical_state(state)
+        key = (state, t, steps_left)
+        r = self.cache.get(key)
+        if r is None:
+            r = self._expand(state, t, steps_left)
+            self.cache[key] = r
+        if swapped and r[0] is not None:
+            return 1 - r[0], r[1]
+        return r
+
+    def _expand(self, state, t, steps_left):
+        """ Computes the action and value of a state that is not a leaf """
+        
+        # the pre-computed value function is 0-based! (t=0 is the first time-step)
+        vApos = self._lookahead((state[0]+1, state[1], state[2], state[3]), t+1, steps_left-1)[1]
+        vAneg = self._lookahead((state[0], state[1]+1, state[2], state[3]), t+1, steps_left-1)[1]
+        vBpos = self._lookahead((state[0], state[1], state[2]+1, state[3]), t+1, steps_left-1)[1]
+        vBneg = self._lookahead((state[0], state[1], state[2], state[3]+1), t+1, steps_left-1)[1]
+
+        pA = state[0] / (state[0] + state[1])
+        qvalueA = pA * (1 + vApos) + (1 - pA) * vAneg
+        
+        pB = state[2] / (state[2] + state[3])
+        qvalueB = pB * (1 + vBpos) + (1 - pB) * vBneg
+
+        # ties are broken in choose so that the cached result is not random
+        if qvalueA > qvalueB:       r = 0, qvalueA
+        elif qvalueA < qvalueB:     r = 1, qvalueB
+        else:                       r = None, qvalueA
+        return r
+
+    def choose(self, t):
+        """ Which arm to choose; t is the current time step. Returns arm index """
+        if not self.shared:
+            self.cache.clear()
+        # change 1-based time to 0-based
+        action = self._lookahead((self.Acountpos, self.Acountneg, self.Bcountpos, self.Bcountneg), t-1, self.lookahead_hor)[0]
+        if action is None:
+            # the same draw as bernoulli(0.5) in basics.py
+            return 1 if random.random() <= 0.5 else 0
+        return action
+
+    def reserve(self, horizon):
+        """ Loads the value function for the time steps that the horizon and lookahead reach """
+        self.valuefunction.reserve(horizon + self.lookahead_hor)
+
+    def update(self, arm, outcome):
+        """ Updates the estimate for the arm outcome """
+        if arm == 0:
+            if outcome == 1:    self.Acountpos += 1
+            else:               self.Acountneg += 1
+        elif arm == 1:
+            if outcome == 1:    self.Bcountpos += 1
+            else:               self.Bcountneg += 1
+        else: raise RuntimeError("Invalid arm number")
@@ -0,0 +1,176 @@
+"""
+Offline evaluation of policies from logged decisions
+
+The logs are csv files with the columns Arm (0 or 1) and Outcome (0 or 1), and
+optionally Propensity, the probability with which the logging policy chose the arm.
+Each file (shard) is read in chunks and every event is offered to all evaluated
+policies, so the log is read only once regardless of their number. Shards are
+processed in parallel and their results are added up.
+
+Two estimators are supported:
+    replay : rejection sampling; an event is used when the policy chooses the logged
+             arm and skipped otherwise. Unbiased when the logging policy chose the
+             arms uniformly at random.
+    ips    : inverse propensity scoring; the outcomes of the used events are weighted
+             by 1 / Propensity. Also reports the self-normalized estimate.
+In both cases the policy is updated only with the events it used. Policies see the
+log as a sequence of episodes of `horizon` used events, each with a new policy.
+"""
+
+import multiprocessing
+import random
+import numpy as np
+import pandas as pa
+
+class _Replay:
+    """ State of the replay of a single policy """
+
+    def __init__(self, method, horizon):
+        self.method = method
+        self.horizon = horizon
+        self.events = 0       # all events offered
+        self.matched = 0      # events used by the policy
+        self.reward = 0.0     # sum of the outcomes of the used events
+        self.weighted = 0.0   # sum of the weighted outcomes of the used events
+        self.weights = 0.0    # sum of the weights of the used events
+        self.episodes = 0
+        self._start()
+
+    def _start(self):
+        self.m = self.method()
+        if hasattr(self.m, 'reserve'):
+            self.m.reserve(self.horizon)
+        self.t = 0
+        self.episodes += 1
+
+    def offer(self, arm, outcome, weight):
+        self.events += 1
+        if self.m.choose(self.t + 1) != arm:
+            return
+        self.m.update(arm, outcome)
+        self.t += 1
+        self.matched += 1
+        self.reward += outcome
+        self.weighted += weight * outcome
+        self.weights += weight
+        if self.t == self.horizon:
+            self._start()
+
+    def result(self):
+        return {'events': self.events, 'matched': self.matched, 'reward': self.reward,
+                'weighted': self.weighted, 'weights': self.weights, 'episodes': self.episodes}
+
+
+def evaluate_shard(filename, methods, horizon, estimator='replay', chunksize=100000):
+    """
+    Replays all policies on a single log file
+
+    Parameters
+    ----------
+    filename : str
+        Csv log with the columns Arm, Outcome and optionally Propensity
+    methods : dict
+        Name -> class or constructor of the policy (the same as in evaluate)
+    horizon : int
+        Number of used events in an episode of a policy
+    estimator : 'replay' or 'ips'
+        The propensities are read and checked only for ips
+
+    Returns
+    -------
+    out : dict
+        Name -> sums of the replay (see evaluate_logged)
+    """
+    replays = {name: _Replay(method, horizon) for name, method in methods.items()}
+    # the file is closed also when a chunk is rejected
+    with pa.read_csv(filename, chunksize=chunksize) as reader:
+        for frame in reader:
+            arms = frame.Arm.values
+            if not np.isin(arms, (0, 1)).all():
+                raise ValueError(filename + ": arms must be 0 or 1")
+            arms = arms.tolist()
+            outcomes = frame.Outcome.values.tolist()
+            if estimator == 'ips':
+                if 'Propensity' not in frame:
+                    raise ValueError(filename + ": the ips estimator needs the Propensity column")
+                propensities = frame.Propensity.values
+                # also rejects missing values
+                if not ((propensities > 0) & (propensities <= 1)).all():
+                    raise ValueError(filename + ": propensities must be in (0, 1]")
+                weights = (1.0 / propensities).tolist()
+            else:
+                weights = [1.0] * len(arms)
+            for arm, outcome, weight in zip(arms, outcomes, weights):
+                for replay in replays.values():
+                    replay.offer(arm, outcome, weight)
+    return {name: replay.result() for name, replay in replays.items()}
+
+
+# policies of the current evaluation; forked workers inherit them, so they need not be picklable
+_methods = None
+
+def _evaluate_shard(args):
+    filename, horizon, estimator, chunksize, seed = args
+    # each shard has its own random stream, also in forked processes
+    random.seed(seed)
+    np.random.seed(seed)
+    return evaluate_shard(filename, _methods, horizon, estimator, chunksize)
+
+
+def evaluate_logged(shards, methods, horizon, estimator='replay', processes=None, chunksize=100000):
+    """
+    Estimates the mean reward per step of policies from logged data
+
+    Parameters
+    ----------
+    shards : list of str
+        Csv log files; they are processed in parallel
+    methods : dict
+        Name -> class or constructor of the policy (the same as in evaluate)
+    horizon : int
+        Number of used events in an episode of a policy
+    estimator : 'replay' or 'ips'
+        ips needs the Propensity column in all shards
+    processes : int, optional
+        Number of worker processes; all cpus by default
+    chunksize : int
+        Number of rows read from a log at once
+
+    Returns
+    -------
+    out : dict
+        Name -> dictionary with:
+            estimate : estimated mean reward per step
+            snips : self-normalized ips estimate (only for ips)
+            events, matched, episodes : numbers of events offered and used, and of episodes started
+    """
+    if estimator not in ('replay', 'ips'):
+        raise ValueError("Unknown estimator: " + str(estimator))
+    if len(shards) == 0:
+        raise ValueError("No shards to evaluate")
+    global _methods
+    _methods = methods
+    arguments = [(shard, horizon, estimator, chunksize, random.getrandbits(32)) for shard in shards]
+    if processes == 1 or len(shards) == 1:
+        # the shards are seeded as in the workers; the random state of the caller is restored
+        state = random.getstate(), np.random.get_state()
+        try:
+            results = [_evaluate_shard(a) for a in arguments]
+        finally:
+            random.setstate(state[0])
+            np.random.set_state(state[1])
+    else:
+        with multiprocessing.get_context('fork').Pool(processes) as pool:
+            results = pool.map(_evaluate_shard, arguments)
+
+    out = {}
+    for name in methods:
+        total = {key: sum(result[name][key] for result in results) for key in results[0][name]}
+        summary = {'events': total['events'], 'matched': total['matched'], 'episodes': total['episodes']}
+        if estimator == 'replay':
+            summary['estimate'] = total['reward'] / total['matched'] if total['matched'] > 0 else np.nan
+        else:
+            summary['estimate'] = total['weighted'] / total['events'] if total['events'] > 0 else np.nan
+            summary['snips'] = total['weighted'] / total['weights'] if total['weights'] > 0 else np.nan
+        out[name] = summary
+    return out
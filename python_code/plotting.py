@@ -5,6 +5,7 @@ Generate plots of value functions constructed based on UCB and Gittins index
 import numpy as np
 import matplotlib
 import pandas as pa
+from valuetables import ValueTable
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
 
@@ -16,15 +17,8 @@ matplotlib.rcParams.update({'font.size': 12})
 
 ## Load Data
 
-ucb_valuefunction = {}
-valuefunction_csv = pa.read_csv('valuecomputation/ucb_value.csv')
-for (t, p, n, v) in zip(valuefunction_csv.Time, valuefunction_csv.Positive, valuefunction_csv.Negative, valuefunction_csv.Value):
-    ucb_valuefunction[(t,p,n)] = v
-
-gittins_valuefunction = {}
-valuefunction_csv = pa.read_csv('valuecomputation/gittins_value.csv')
-for (t, p, n, v) in zip(valuefunction_csv.Time, valuefunction_csv.Positive, valuefunction_csv.Negative, valuefunction_csv.Value):
-    gittins_valuefunction[(t,p,n)] = v
+ucb_valuefunction = ValueTable.from_csv('valuecomputation/ucb_value.csv')
+gittins_valuefunction = ValueTable.from_csv('valuecomputation/gittins_value.csv')
     
 
 ## Plotting function
@@ -0,0 +1,148 @@
+"""
+Non-stationary bandit scenarios
+
+A scenario generates the success probabilities of the two arms in every step of a
+run. The probabilities are produced lazily by stream(horizon) in chunks of at most
+`chunk` steps, each an array of shape (steps, 2), so that long horizons never hold
+the whole (horizon x arms) array of a run. Every call of stream generates a new
+independent realization using np.random.
+
+Scenarios are used as the items of runs in evaluate, for example
+    evaluate(UCB, horizon, [RandomWalk(sigma=0.02)] * 1000)
+and the regret in each step is computed with respect to the best arm in that step.
+"""
+
+import numpy as np
+import pandas as pa
+
+class Scenario:
+    """ Base class of scenarios; subclasses implement stream """
+
+    def __init__(self, chunk=1024):
+        self.chunk = chunk
+
+    def stream(self, horizon):
+        """ Yields arrays of shape (steps, 2) whose steps add up to horizon """
+        raise NotImplementedError()
+
+    def probabilities(self, horizon):
+        """ All probabilities of a single realization; useful for plotting """
+        return np.concatenate(list(self.stream(horizon)))
+
+
+class PiecewiseConstant(Scenario):
+    """
+    Probabilities that stay constant between switches
+
+    Parameters
+    ----------
+    segments : list of (step, pA, pB), optional
+        Deterministic switches; the probabilities (pA, pB) apply from the 0-based
+        step until the next segment. The first segment must start at step 0.
+    switch_probability : float, optional
+        When segments are not given, the probabilities switch in each step with this
+        probability and the new ones are drawn from the uniform beta distribution
+    """
+
+    def __init__(self, segments=None, switch_probability=0.01, chunk=1024):
+        Scenario.__init__(self, chunk)
+        if segments is not None and segments[0][0] != 0:
+            raise ValueError("The first segment must start at step 0")
+        self.segments = segments
+        self.switch_probability = switch_probability
+
+    def stream(self, horizon):
+        if self.segments is not None:
+            starts = np.array([s[0] for s in self.segments])
+            values = np.array([(s[1], s[2]) for s in self.segments])
+        current = None
+        for start in range(0, horizon, self.chunk):
+            steps = min(self.chunk, horizon - start)
+            if self.segments is not None:
+                segment = np.searchsorted(starts, np.arange(start, start + steps), side='right') - 1
+                yield values[segment]
+            else:
+                switches = np.random.random_sample(steps) < self.switch_probability
+                switches[0] |= start == 0
+                draws = np.random.beta(1, 1, size=(int(switches.sum()), 2))
+                if start > 0:
+                    draws = np.vstack([current, draws])
+                # index of the last switch before each step
+                segment = np.cumsum(switches) - (0 if start > 0 else 1)
+                chunk = draws[segment]
+                current = chunk[-1]
+                yield chunk
+
+
+class RandomWalk(Scenario):
+    """
+    Gaussian random walk of each arm's probability, reflected at 0 and 1
+
+    Parameters
+    ----------
+    start : (pA, pB), optional
+        Initial probabilities; drawn from the uniform beta distribution when not given
+    sigma : float
+        Standard deviation of the step
+    """
+
+    def __init__(self, start=None, sigma=0.01, chunk=1024):
+        Scenario.__init__(self, chunk)
+        self.start = start
+        self.sigma = sigma
+
+    def stream(self, horizon):
+        # unconstrained walk; folding it into [0, 1] gives the reflected walk
+        if self.start is None:
+            position = np.random.beta(1, 1, size=2)
+        else:
+            position = np.array(self.start, dtype=float)
+        for start in range(0, horizon, self.chunk):
+            steps = min(self.chunk, horizon - start)
+            increments = np.random.normal(0, self.sigma, size=(steps, 2))
+            if start == 0:
+                # the walk starts at the initial probabilities
+                increments[0] = 0
+            walk = position + np.cumsum(increments, 0)
+            position = walk[-1]
+            folded = np.mod(walk, 2)
+            yield np.where(folded > 1, 2 - folded, folded)
+
+
+class LoggedRates(Scenario):
+    """
+    Replay of logged success rate curves from a csv file with the columns
+    RateA and RateB, one row per step. The file is read in chunks; when the
+    horizon is longer than the log, the last rates are kept.
+
+    Parameters
+    ----------
+    filename : str
+    offset : int
+        Number of rows to skip at the start of the log
+    """
+
+    def __init__(self, filename, offset=0, chunk=1024):
+        Scenario.__init__(self, chunk)
+        self.filename = filename
+        self.offset = offset
+
+    def stream(self, horizon):
+        produced = 0
+        last = None
+        # the file is closed also when the log is longer than the horizon
+        with pa.read_csv(self.filename, usecols=['RateA', 'RateB'], chunksize=self.chunk,
+                         skiprows=range(1, self.offset + 1)) as reader:
+            for frame in reader:
+                chunk = frame[['RateA', 'RateB']].values[:horizon - produced]
+                produced += chunk.shape[0]
+                last = chunk[-1]
+                yield chunk
+                if produced >= horizon:
+                    return
+        if last is None:
+            raise ValueError("The log has no rows")
+        while produced < horizon:
+            steps = min(self.chunk, horizon - produced)
+            produced += steps
+            yield np.tile(last, (steps, 1))
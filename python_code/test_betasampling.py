@@ -0,0 +1,66 @@
+import random
+import numpy as np
+import pytest
+import scipy.special
+from betasampling import BetaTable, compare_with_numpy
+
+# includes the skewed posteriors at the ends of a run with horizon 290
+pairs = [(1, 1), (3, 7), (50, 50), (1, 290), (290, 1), (2, 150)]
+samples = 200000
+tail = 0.001
+
+
+@pytest.fixture
+def table():
+    random.seed(0)
+    np.random.seed(0)
+    return BetaTable(292)
+
+
+def check_tail(fraction):
+    # within 5 standard errors of the binomial fraction
+    assert abs(fraction - tail) < 5 * np.sqrt(tail * (1 - tail) / samples)
+
+
+@pytest.mark.parametrize('alpha, beta', pairs)
+def test_sample(table, alpha, beta):
+    result, = compare_with_numpy(table, [(alpha, beta)], samples, tail)
+    assert result['pvalue'] > 1e-4
+    assert abs(result['mean_z']) < 5
+    check_tail(result['lower'])
+    check_tail(result['upper'])
+
+
+@pytest.mark.parametrize('alpha, beta', pairs)
+def test_draw(table, alpha, beta):
+    drawn = np.array([table.draw(alpha, beta) for _ in range(samples)])
+    mean = alpha / (alpha + beta)
+    std = np.sqrt(alpha * beta / ((alpha + beta) ** 2 * (alpha + beta + 1)))
+    assert abs(drawn.mean() - mean) < 5 * std / np.sqrt(samples)
+    low, high = scipy.special.betaincinv(alpha, beta, [tail, 1 - tail])
+    check_tail(np.mean(drawn < low))
+    check_tail(np.mean(drawn > high))
+
+
+def test_expected_maximum(table):
+    # the quantity averaged by OptimisticLookAhead
+    alphas = np.array([[1], [2]])
+    betas = np.array([[290], [150]])
+    tabulated = np.max(table.sample(alphas, betas, size=(2, samples)), axis=0)
+    exact = np.max(np.random.beta(alphas, betas, size=(2, samples)), axis=0)
+    stderr = np.sqrt((tabulated.var() + exact.var()) / samples)
+    assert abs(tabulated.mean() - exact.mean()) < 5 * stderr
+
+
+def test_outside_table(table):
+    # parameters outside the table fall back to np.random.beta
+    assert table.sample(0.5, 0.5, size=10).shape == (10,)
+    assert table.sample(np.array([1, 500]), np.array([1, 1])).shape == (2,)
+    assert 0 <= table.draw(300, 300) <= 1
+    # non-integer parameters are not truncated to the tabulated ones
+    assert abs(table.sample(2.5, 3.5, size=samples).mean() - 2.5 / 6) < 0.003
+    assert abs(np.mean([table.draw(2.5, 3.5) for _ in range(samples)]) - 2.5 / 6) < 0.003
+    mixed = table.sample(np.array([[2.5], [2]]), np.array([[3.5], [3]]), size=(2, samples))
+    assert np.allclose(mixed.mean(1), [2.5 / 6, 2 / 5], atol=0.003)
+    assert 0 <= table.sample(0.5, 0.5) <= 1
+    assert 0 <= table.draw(0.5, 0.5) <= 1
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+from confidence import bootstrap_bands, RegretMoments
+
+
+def check_bands(data, mean, lower, upper):
+    # every replicate mean is a weighted mean of the rows
+    assert np.allclose(mean, data.mean(0))
+    assert (lower >= data.min(0) - 1e-9).all()
+    assert (upper <= data.max(0) + 1e-9).all()
+    assert (lower <= mean).all() and (mean <= upper).all()
+
+
+@pytest.mark.parametrize('method', ['percentile', 'bca'])
+def test_few_runs(method):
+    # a replicate draws none of the 3 runs with probability exp(-3)
+    data = 10 + np.random.RandomState(1).randn(3, 5)
+    check_bands(data, *bootstrap_bands(data, method=method, seed=0))
+
+
+@pytest.mark.parametrize('method', ['percentile', 'bca'])
+def test_few_chunks(method):
+    data = 10 + np.random.RandomState(2).randn(4000, 20).cumsum(1)
+    chunks = []
+    for block in np.split(data, 4):
+        moments = RegretMoments(data.shape[1])
+        moments.add(block)
+        chunks.append(moments)
+    mean, lower, upper = bootstrap_bands(chunks, method=method, seed=0)
+    block_means = data.reshape(4, 1000, -1).mean(1)
+    assert np.allclose(mean, data.mean(0))
+    assert (lower >= block_means.min(0) - 1e-9).all()
+    assert (upper <= block_means.max(0) + 1e-9).all()
+
+
+def test_chunks_match_matrix():
+    data = np.random.RandomState(3).rand(500, 10).cumsum(1)
+    whole = bootstrap_bands(data, seed=4)
+    chunked = bootstrap_bands(np.split(data, 5), seed=4)
+    assert np.allclose(whole[0], chunked[0])
+    # the bands differ only by the Monte Carlo error of the replicates
+    assert np.allclose(whole[1], chunked[1], atol=0.1)
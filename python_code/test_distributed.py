@@ -0,0 +1,45 @@
+import os
+import time
+import numpy as np
+import pytest
+
+# basics (imported by distributed) reads the Gittins indexes when it is imported
+if not os.path.exists(os.path.join('valuecomputation', 'gittins.csv')):
+    pytest.skip("valuecomputation/gittins.csv is needed to import basics", allow_module_level=True)
+
+from basics import Thompson
+from distributed import submit, run_local
+
+horizon = 30
+runs = [(0.3, 0.6), (0.7, 0.4), None, (0.5, 0.5)] * 6
+
+
+@pytest.fixture
+def reference(tmp_path):
+    directory = str(tmp_path / 'reference')
+    submit(directory, runs, horizon, unit_size=5, seed=7)
+    return run_local(directory, Thompson, workers=1, poll=0.1)
+
+
+def test_workers(tmp_path, reference):
+    directory = str(tmp_path / 'sweep')
+    submit(directory, runs, horizon, unit_size=5, seed=7)
+    regrets = run_local(directory, Thompson, workers=3, poll=0.1)
+    assert regrets.shape == (len(runs), horizon)
+    assert np.array_equal(regrets, reference)
+    assert os.listdir(os.path.join(directory, 'pending')) == []
+    assert os.listdir(os.path.join(directory, 'claimed')) == []
+
+
+def test_dead_claim(tmp_path, reference):
+    directory = str(tmp_path / 'sweep')
+    submit(directory, runs, horizon, unit_size=5, seed=7)
+    # a worker claimed unit 2 and died; its lease is renewed just now and expires in a second
+    os.rename(os.path.join(directory, 'pending', '00000002.json'),
+              os.path.join(directory, 'claimed', '00000002.dead'))
+    start = time.time()
+    regrets = run_local(directory, Thompson, workers=3, lease=1.0, poll=0.1)
+    assert time.time() - start >= 1.0
+    assert np.array_equal(regrets, reference)
+    assert len(os.listdir(os.path.join(directory, 'results'))) == 5
+    assert os.listdir(os.path.join(directory, 'claimed')) == []
@@ -0,0 +1,72 @@
+import random
+import pytest
+from lookahead import ValueFunctionLookahead
+from transposition import TranspositionCache, SharedTranspositionCache, canonical_state
+from valuetables import ValueTable, time_offset
+
+horizon = 60
+depth = 3
+runs = [(0.3, 0.6), (0.6, 0.3), (0.5, 0.5), (0.05, 0.02), (0.9, 0.85)]
+
+
+def value_table(levels):
+    """ Values of a greedy policy; many states are tied, which exercises the tie breaking """
+    values = []
+    for t in range(levels):
+        for level in range(t + 1):
+            for positive in range(1, level + 2):
+                values.append((levels - t) * positive / (level + 2))
+    assert len(values) == time_offset(levels)
+    return ValueTable.encode(values, levels, 'float64')
+
+
+class Uncached(ValueFunctionLookahead):
+    """ The lookahead before the caches: no cache and no canonical states """
+
+    def _lookahead(self, state, t, steps_left):
+        if steps_left == 0:
+            return ValueFunctionLookahead._lookahead(self, state, t, steps_left)
+        return self._expand(state, t, steps_left)
+
+
+def trajectories(method):
+    """ Arms and outcomes of all the runs with fixed seeds """
+    out = []
+    for seed, (pA, pB) in enumerate(runs):
+        random.seed(seed)
+        m = method()
+        arms, outcomes = [], []
+        for t in range(horizon):
+            arm = m.choose(t + 1)
+            outcome = 1 if random.random() <= (pA if arm == 0 else pB) else 0
+            m.update(arm, outcome)
+            arms.append(arm)
+            outcomes.append(outcome)
+        out.append((arms, outcomes))
+    return out
+
+
+def test_canonical_state():
+    assert canonical_state((3, 1, 2, 5)) == ((2, 5, 3, 1), True)
+    assert canonical_state((2, 5, 3, 1)) == ((2, 5, 3, 1), False)
+    assert canonical_state((2, 2, 2, 2)) == ((2, 2, 2, 2), False)
+
+
+@pytest.mark.parametrize('cache', [None, TranspositionCache(), TranspositionCache(capacity=100),
+                                   SharedTranspositionCache(slots=2**12)])
+def test_identical_trajectories(cache):
+    table = value_table(horizon + depth)
+    expected = trajectories(lambda: Uncached(table, depth))
+    assert trajectories(lambda: ValueFunctionLookahead(table, depth, cache=cache)) == expected
+
+
+def test_mirrored_decisions():
+    table = value_table(horizon + depth)
+    m = ValueFunctionLookahead(table, depth)
+    for state in [(3, 1, 2, 5), (1, 4, 2, 2), (6, 2, 5, 3)]:
+        t = sum(state) - 4
+        mirrored = (state[2], state[3], state[0], state[1])
+        action, value = m._lookahead(state, t, depth)
+        mirrored_action, mirrored_value = m._lookahead(mirrored, t, depth)
+        assert value == mirrored_value
+        assert action is None and mirrored_action is None or action == 1 - mirrored_action
@@ -0,0 +1,44 @@
+import os
+import random
+import numpy as np
+import pytest
+import scipy.integrate
+import scipy.stats
+
+# basics reads the Gittins indexes when it is imported
+if not os.path.exists(os.path.join('valuecomputation', 'gittins.csv')):
+    pytest.skip("valuecomputation/gittins.csv is needed to import basics", allow_module_level=True)
+
+import basics
+from basics import thompson_probability, evaluate, evaluate_exact, Thompson, ThompsonExact
+
+states = [(1, 1, 1, 1), (3, 7, 5, 2), (10, 3, 2, 8), (2, 5, 2, 5), (1, 30, 4, 1), (40, 60, 45, 55)]
+
+
+def integrated(Acountpos, Acountneg, Bcountpos, Bcountneg):
+    """ P(X > Y) = integral of the density of X times the CDF of Y """
+    f = lambda x: scipy.stats.beta.pdf(x, Acountpos, Acountneg) * scipy.stats.beta.cdf(x, Bcountpos, Bcountneg)
+    return scipy.integrate.quad(f, 0, 1, epsabs=1e-13, epsrel=1e-12, limit=200)[0]
+
+
+@pytest.mark.parametrize('state', states)
+def test_probability(state):
+    basics.thompson_probabilities.clear()
+    mirrored = (state[2], state[3], state[0], state[1])
+    assert thompson_probability(*state) == pytest.approx(integrated(*state), abs=1e-10)
+    # the second one is computed from the cached canonical state
+    assert thompson_probability(*mirrored) == pytest.approx(integrated(*mirrored), abs=1e-10)
+    assert thompson_probability(*state) + thompson_probability(*mirrored) == pytest.approx(1.0, abs=1e-12)
+
+
+@pytest.mark.parametrize('method', [Thompson, ThompsonExact])
+def test_evaluate_exact(method):
+    horizon = 30
+    runs = [(0.3, 0.6), (0.55, 0.5)]
+    exact = evaluate_exact(ThompsonExact, horizon, runs)
+    random.seed(0)
+    np.random.seed(0)
+    for irun, run in enumerate(runs):
+        sampled = evaluate(method, horizon, [run] * 4000)
+        stderr = sampled.std(0) / np.sqrt(sampled.shape[0])
+        assert (np.abs(sampled.mean(0) - exact[irun]) <= 4 * stderr + 1e-12).all()
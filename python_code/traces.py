@@ -0,0 +1,233 @@
+"""
+Compact recording of the actions and outcomes of evaluation runs
+
+Each step of a run is stored in 2 bits (arm << 1 | outcome), four steps per byte.
+The trace file is a sequence of chunks; every chunk holds up to `chunk_size` runs
+and consists of three consecutive .npy arrays:
+    packed : uint8, runs x ceil(horizon / 4), the packed steps
+    probs  : float64, runs x 2, the true arm probabilities (pA, pB)
+    seeds  : uint32, runs, the seed used to initialize `random` and `np.random`
+"""
+
+import numpy as np
+import random
+
+## Packing
+
+def pack_steps(arms, outcomes):
+    """
+    Packs arm choices and outcomes into 2 bits per step
+
+    Parameters
+    ----------
+    arms : array of ints (0 or 1), the last dimension is the time step
+    outcomes : array of ints (0 or 1), same shape as arms
+
+    Returns
+    -------
+    out : ndarray of uint8, the last dimension is ceil(horizon / 4)
+    """
+    codes = (np.asarray(arms, dtype=np.uint8) << 1) | np.asarray(outcomes, dtype=np.uint8)
+    horizon = codes.shape[-1]
+    padding = (-horizon) % 4
+    if padding > 0:
+        codes = np.concatenate([codes, np.zeros(codes.shape[:-1] + (padding,), dtype=np.uint8)], -1)
+    codes = codes.reshape(codes.shape[:-1] + (-1, 4))
+    return (codes[..., 0] << 6) | (codes[..., 1] << 4) | (codes[..., 2] << 2) | codes[..., 3]
+
+
+def unpack_steps(packed, horizon):
+    """
+    Inverse of pack_steps
+
+    Returns
+    -------
+    arms, outcomes : ndarrays of uint8 with the last dimension equal to horizon
+    """
+    packed = np.asarray(packed, dtype=np.uint8)
+    codes = np.stack([(packed >> 6) & 3, (packed >> 4) & 3, (packed >> 2) & 3, packed & 3], -1)
+    codes = codes.reshape(packed.shape[:-1] + (-1,))[..., :horizon]
+    return codes >> 1, codes & 1
+
+## Writing
+
+class TraceWriter:
+    """
+    Collects traces of runs from evaluate and writes them to a chunked file.
+
+    Use as a context manager or call close() to flush the last chunk.
+    """
+
+    def __init__(self, filename, horizon, chunk_size=4096):
+        self.filename = filename
+        self.horizon = horizon
+        self.chunk_size = chunk_size
+        self.file = open(filename, 'wb')
+        self._clear()
+
+    def _clear(self):
+        self.packed = []
+        self.probs = []
+        self.seeds = []
+
+    def new_seed(self):
+        """ Returns a fresh seed for a run """
+        return random.getrandbits(32)
+
+    def record(self, arms, outcomes, pA, pB, seed):
+        """ Records a single run """
+        if len(arms) != self.horizon:
+            raise ValueError("Trace length does not match the horizon")
+        self.packed.append(pack_steps(arms, outcomes))
+        self.probs.append((pA, pB))
+        self.seeds.append(seed)
+        if len(self.seeds) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """ Writes the collected runs as a chunk """
+        if not self.seeds:
+            return
+        np.save(self.file, np.array(self.packed, dtype=np.uint8))
+        np.save(self.file, np.array(self.probs, dtype=np.float64))
+        np.save(self.file, np.array(self.seeds, dtype=np.uint32))
+        self.file.flush()
+        self._clear()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+## Reading
+
+def _skip_array(f):
+    """ Reads the header of an .npy array and skips its data; returns the array shape """
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+    else:
+        shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+    f.seek(int(np.prod(shape)) * dtype.itemsize, 1)
+    return shape
+
+
+class TraceReader:
+    """
+    Random access to the runs in a trace file. Only the chunk headers are read
+    when opening; a chunk is loaded when one of its runs is requested.
+    """
+
+    def __init__(self, filename, horizon):
+        self.filename = filename
+        self.horizon = horizon
+        self.chunks = []    # list of (offset, first run, number of runs)
+        self.loaded = None  # (index, packed, probs, seeds) of the last loaded chunk
+        runs = 0
+        with open(filename, 'rb') as f:
+            f.seek(0, 2)
+            size = f.tell()
+            f.seek(0)
+            while f.tell() < size:
+                offset = f.tell()
+                count = _skip_array(f)[0]
+                _skip_array(f)
+                _skip_array(f)
+                self.chunks.append((offset, runs, count))
+                runs += count
+        self.runs = runs
+
+    def __len__(self):
+        return self.runs
+
+    def _chunk(self, index):
+        if self.loaded is None or self.loaded[0] != index:
+            with open(self.filename, 'rb') as f:
+                f.seek(self.chunks[index][0])
+                self.loaded = (index, np.load(f), np.load(f), np.load(f))
+        return self.loaded
+
+    def run(self, irun):
+        """
+        Returns
+        -------
+        arms, outcomes, (pA, pB), seed of the run irun
+        """
+        if irun < 0 or irun >= self.runs:
+            raise IndexError("Run index out of range")
+        index = next(i for i, (_, first, count) in enumerate(self.chunks) if irun < first + count)
+        _, packed, probs, seeds = self._chunk(index)
+        local = irun - self.chunks[index][1]
+        arms, outcomes = unpack_steps(packed[local], self.horizon)
+        return arms, outcomes, tuple(probs[local]), int(seeds[local])
+
+## Replay
+
+def belief_trajectory(arms, outcomes):
+    """
+    Reconstructs the belief states of a run
+
+    Returns
+    -------
+    out : ndarray, (horizon+1) x 4
+        Row t is the state (Acountpos, Acountneg, Bcountpos, Bcountneg) before
+        step t (0-based) is taken; the last row is the final state.
+    """
+    arms = np.asarray(arms, dtype=int)
+    outcomes = np.asarray(outcomes, dtype=int)
+    increments = np.zeros((len(arms) + 1, 4), dtype=int)
+    increments[0, :] = 1
+    increments[np.arange(1, len(arms) + 1), 2 * arms + (1 - outcomes)] = 1
+    return np.cumsum(increments, 0)
+
+
+def query_decisions(method, arms, outcomes, steps):
+    """
+    Re-queries the decisions of a policy at the given 0-based steps of a recorded
+    run. The policy is brought to each state by calling update with the recorded
+    arms and outcomes; choose is only called at the requested steps.
+
+    Note that the recorded policy need not be the queried one and that randomized
+    policies return a fresh sample rather than the recorded decision.
+
+    Returns
+    -------
+    out : list of arm indexes, one for each of the steps
+    """
+    decisions = []
+    m = method()
+    if hasattr(m, 'reserve') and len(steps) > 0:
+        m.reserve(max(steps) + 1)
+    t = 0
+    for step in sorted(steps):
+        for t in range(t, step):
+            m.update(int(arms[t]), int(outcomes[t]))
+        t = step
+        decisions.append((step, m.choose(step + 1)))
+    order = dict(decisions)
+    return [order[step] for step in steps]
+
+
+def replay_run(method, reader, irun):
+    """
+    Re-simulates a recorded run from its seed and true probabilities. This is
+    exact only when method is the policy that was recorded.
+
+    Returns
+    -------
+    losses, arms, outcomes : see basics.simulate
+    """
+    from basics import simulate
+    _, _, (pA, pB), seed = reader.run(irun)
+    random.seed(seed)
+    np.random.seed(seed)
+    # as in evaluate
+    m = method()
+    if hasattr(m, 'reserve'):
+        m.reserve(reader.horizon)
+    return simulate(m, pA, pB, reader.horizon)
@@ -0,0 +1,184 @@
+"""
+Transposition caches for the lookahead in ValueFunctionLookahead (lookahead.py)
+
+The result of the lookahead from a belief state depends only on the state, the time
+step, the remaining depth, and the value function. A cache keyed by (state, t, depth)
+can be therefore shared by all runs that use the same value function and scale.
+
+The entries are (action, value) where action is None when the two arms are tied; the
+tie is broken at the root of the lookahead so that sharing entries does not share the
+random tie breaking.
+
+Eviction keeps the entries with a small t: every run passes through the few states at
+the start, while the states at a large t are spread over many more states and are
+rarely reused by other runs.
+"""
+
+import multiprocessing
+import numpy as np
+
+def canonical_state(state):
+    """ 
+    Orders the arms in the state (Acountpos, Acountneg, Bcountpos, Bcountneg) 
+    so that the counts of arm A are not greater than those of arm B. All the 
+    methods treat the arms symmetrically, so the mirrored states have the same 
+    values and mirrored decisions.
+    
+    Returns: canonical state, whether the arms were swapped
+    """
+    if (state[2], state[3]) < (state[0], state[1]):
+        return (state[2], state[3], state[0], state[1]), True
+    return state, False
+
+
+class TranspositionCache:
+    """
+    Bounded cache for a single process, used like a dictionary with get and
+    item assignment. When full, all entries of the largest time step are dropped.
+
+    Parameters
+    ----------
+    capacity : int
+        Maximal number of entries
+    """
+
+    def __init__(self, capacity=10**6):
+        self.capacity = capacity
+        self.levels = {}  # t -> {key : entry}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        level = self.levels.get(key[1])
+        entry = None if level is None else level.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def __setitem__(self, key, entry):
+        level = self.levels.setdefault(key[1], {})
+        if key not in level:
+            self.size += 1
+        level[key] = entry
+        while self.size > self.capacity:
+            deepest = self.levels.pop(max(self.levels))
+            self.size -= len(deepest)
+            self.evictions += len(deepest)
+
+    def clear(self):
+        self.levels.clear()
+        self.size = 0
+
+    def stats(self):
+        """ Returns the hit, miss, and eviction counts and the hit rate """
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'size': self.size, 'hit_rate': self.hits / lookups if lookups > 0 else 0.0}
+
+
+class SharedTranspositionCache:
+    """
+    Fixed-size hash table in shared memory, used like TranspositionCache. It must be
+    created before the worker processes are forked (for example by distributed.run_local)
+    and then each process reads and adds entries of the others. The statistics count
+    only the lookups of the calling process.
+
+    Keys are packed into 64 bits, so the counts and t must be smaller than 1024 and the
+    depth smaller than 64; other keys are not cached. Each key is placed in one of `probes`
+    consecutive slots; when all of them are taken, the entry with the largest t is replaced.
+    An entry is written by clearing the key, writing the value, and then writing the key;
+    a reader accepts the value only when the key is the same before and after reading it.
+
+    Parameters
+    ----------
+    slots : int
+        Number of entries in the table (rounded up to a power of 2)
+    probes : int
+        Number of slots where a key may be placed
+    """
+
+    def __init__(self, slots=2**22, probes=8):
+        self.bits = max(1, int(np.ceil(np.log2(slots))))
+        self.slots = 2 ** self.bits
+        self.probes = probes
+        # memoryviews of the shared arrays; indexing them gives Python numbers and is
+        # much faster than indexing the arrays or numpy views of them
+        self.keys = memoryview(multiprocessing.RawArray('q', self.slots)).cast('B').cast('q')
+        self.values = memoryview(multiprocessing.RawArray('d', self.slots)).cast('B').cast('d')
+        self.actions = memoryview(multiprocessing.RawArray('b', self.slots)).cast('B').cast('b')
+        self.mask = self.slots - 1
+        self.shift = 64 - self.bits
+        self.lock = multiprocessing.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _pack(key):
+        """ Packs (state, t, depth) to a positive integer; returns None when it does not fit """
+        (a, b, c, d), t, depth = key
+        if (a | b | c | d | t) >= 1024 or depth >= 64:
+            return None
+        return ((((((a << 10 | b) << 10 | c) << 10 | d) << 10 | t) << 6) | depth) + 1
+
+    def get(self, key):
+        # _pack and the home slot (Fibonacci hashing) are inlined; get is called for
+        # every node of the lookahead
+        (a, b, c, d), t, depth = key
+        if (a | b | c | d | t) < 1024 and depth < 64:
+            packed = ((((((a << 10 | b) << 10 | c) << 10 | d) << 10 | t) << 6) | depth) + 1
+            keys = self.keys
+            mask = self.mask
+            home = ((packed * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> self.shift
+            for i in range(self.probes):
+                slot = (home + i) & mask
+                current = keys[slot]
+                if current == packed:
+                    value = self.values[slot]
+                    action = self.actions[slot]
+                    if keys[slot] == packed:
+                        self.hits += 1
+                        return (None if action < 0 else action), value
+                elif current == 0:
+                    # slots are never emptied, so the key is not further on
+                    # (except while an entry is written, which only causes a miss)
+                    break
+        self.misses += 1
+        return None
+
+    def __setitem__(self, key, entry):
+        packed = self._pack(key)
+        if packed is None:
+            return
+        keys = self.keys
+        mask = self.mask
+        home = ((packed * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> self.shift
+        with self.lock:
+            victim = None
+            for i in range(self.probes):
+                slot = (home + i) & mask
+                current = keys[slot]
+                if current == 0 or current == packed:
+                    victim = slot
+                    break
+                # the time step of the packed key
+                if victim is None or (current - 1) >> 6 & 1023 > (keys[victim] - 1) >> 6 & 1023:
+                    victim = slot
+            if keys[victim] not in (0, packed):
+                self.evictions += 1
+            action, value = entry
+            keys[victim] = 0
+            self.values[victim] = value
+            self.actions[victim] = -1 if action is None else action
+            keys[victim] = packed
+
+    def stats(self):
+        """ Returns the hit, miss, and eviction counts of this process and the hit rate """
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'size': int(np.count_nonzero(self.keys)),
+                'hit_rate': self.hits / lookups if lookups > 0 else 0.0}
@@ -0,0 +1,250 @@
+"""
+Compact storage of the value functions computed by valuecomputation/compute_values.cpp
+
+Only reachable cells are stored: at the 0-based time step t the states (positive, negative)
+satisfy positive + negative - 2 <= t. The cells are laid out in a flat array ordered by the
+time step, then by the level (positive + negative - 2), then by the positive count. This is
+the same order in which compute_values.cpp writes the csv file.
+
+Supported encodings:
+    float64 : no loss
+    float32 : half the memory
+    uint16  : quarter of the memory, affine quantization with a scale and offset per time step;
+              saved files delta-encode the quantized values to compress better
+
+Tables are loaded as float64 by default. The lossy encodings can turn ties between the
+arms into strict preferences and the other way around, so measure their effect on the
+decisions with decision_changes before using them in experiments.
+"""
+
+import numpy as np
+import pandas as pa
+import random
+import zipfile
+
+## Layout
+
+def time_offset(t):
+    """ Index of the first cell of the time step t (also the number of cells before t) """
+    return t * (t + 1) * (t + 2) // 6
+
+
+def cell_index(t, positive, negative):
+    """ Index of the cell in the flat layout; works with scalars and arrays """
+    level = positive + negative - 2
+    return time_offset(t) + level * (level + 1) // 2 + positive - 1
+
+## Tables
+
+class ValueTable:
+    """
+    Value function indexed as table[(t, positive, negative)], a drop-in replacement
+    for the dictionaries built from the csv files.
+
+    Parameters
+    ----------
+    values : ndarray
+        Encoded values in the flat layout
+    levels : int
+        Number of time steps in the table
+    encoding : str
+        One of 'float64', 'float32', 'uint16'
+    scales, offsets : ndarray, optional
+        Per time step quantization parameters (only for uint16)
+    error : float
+        Maximal absolute difference between the encoded and the original values
+    source : str, optional
+        File from which further time steps are loaded on demand (see open and reserve)
+    """
+
+    encodings = ('float64', 'float32', 'uint16')
+
+    def __init__(self, values, levels, encoding='float64', scales=None, offsets=None, error=0.0, source=None):
+        if encoding not in self.encodings:
+            raise ValueError("Unknown encoding: " + str(encoding))
+        self.values = values
+        self.levels = levels
+        self.encoding = encoding
+        self.scales = scales
+        self.offsets = offsets
+        self.error = error
+        self.source = source
+
+    def __getitem__(self, key):
+        t, positive, negative = key
+        if t >= self.levels and self.source is not None:
+            # reserve re-reads the file from the start, so the table grows geometrically
+            self.reserve(max(t + 1, 2 * self.levels))
+        if t < 0 or t >= self.levels or positive < 1 or negative < 1 or positive + negative - 2 > t:
+            raise KeyError(key)
+        value = self.values[cell_index(t, positive, negative)]
+        if self.encoding == 'uint16':
+            return self.offsets[t] + self.scales[t] * value
+        return float(value)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+    def decode(self):
+        """ Returns all values as float64 in the flat layout """
+        if self.encoding == 'uint16':
+            steps = np.repeat(np.arange(self.levels), np.diff(time_offset(np.arange(self.levels + 1))))
+            return self.offsets[steps] + self.scales[steps] * self.values
+        return self.values.astype(np.float64)
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + sum(a.nbytes for a in (self.scales, self.offsets) if a is not None)
+
+    @staticmethod
+    def encode(values, levels, encoding='float32'):
+        """ Constructs a table from float64 values in the flat layout """
+        values = np.asarray(values, dtype=np.float64)
+        if encoding == 'uint16':
+            bounds = time_offset(np.arange(levels + 1))
+            offsets = np.minimum.reduceat(values, bounds[:-1])
+            scales = (np.maximum.reduceat(values, bounds[:-1]) - offsets) / 65535
+            scales[scales == 0] = 1.0
+            steps = np.repeat(np.arange(levels), np.diff(bounds))
+            encoded = np.round((values - offsets[steps]) / scales[steps]).astype(np.uint16)
+            table = ValueTable(encoded, levels, encoding, scales, offsets)
+        elif encoding in ValueTable.encodings:
+            table = ValueTable(values.astype(encoding), levels, encoding)
+        else:
+            raise ValueError("Unknown encoding: " + str(encoding))
+        table.error = float(np.max(np.abs(table.decode() - values)))
+        return table
+
+    @staticmethod
+    def from_csv(filename, encoding='float64', levels=None):
+        """
+        Loads the csv file written by compute_values.cpp. When levels is given, only
+        the rows of the time steps t < levels are read.
+        """
+        csv = pa.read_csv(filename, nrows=None if levels is None else time_offset(levels))
+        levels = int(csv.Time.max()) + 1
+        values = np.full(time_offset(levels), np.nan)
+        values[cell_index(csv.Time.values, csv.Positive.values, csv.Negative.values)] = csv.Value.values
+        if np.isnan(values).any():
+            raise ValueError("The value function is missing reachable states")
+        return ValueTable.encode(values, levels, encoding)
+
+    def save(self, filename):
+        """ Saves the table in the compressed numpy format """
+        if self.encoding == 'uint16':
+            values = np.diff(self.values, prepend=np.uint16(0))
+            extra = {'scales': self.scales, 'offsets': self.offsets}
+        else:
+            values = self.values
+            extra = {}
+        np.savez_compressed(filename, values=values, levels=self.levels,
+                            encoding=self.encoding, error=self.error, **extra)
+
+    @staticmethod
+    def load(filename, levels=None):
+        """
+        Loads a table saved by save. When levels is given, only the time steps
+        t < levels are decompressed and read.
+        """
+        data = np.load(filename)
+        levels = int(data['levels']) if levels is None else min(levels, int(data['levels']))
+        encoding = str(data['encoding'])
+        with zipfile.ZipFile(filename) as archive, archive.open('values.npy') as f:
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                dtype = np.lib.format.read_array_header_1_0(f)[2]
+            else:
+                dtype = np.lib.format.read_array_header_2_0(f)[2]
+            count = time_offset(levels)
+            values = np.frombuffer(f.read(count * dtype.itemsize), dtype=dtype, count=count)
+        if encoding == 'uint16':
+            return ValueTable(np.cumsum(values, dtype=np.uint16), levels, encoding,
+                              data['scales'][:levels], data['offsets'][:levels], float(data['error']))
+        return ValueTable(values, levels, encoding, error=float(data['error']))
+
+    @staticmethod
+    def open(filename, encoding='float64'):
+        """
+        Opens a csv or a saved table without reading it. Time steps are read when
+        they are first requested or reserved; encoding only applies to csv files.
+        """
+        return ValueTable(np.zeros(0, dtype=encoding), 0, encoding, source=filename)
+
+    def reserve(self, levels):
+        """
+        Makes sure that the time steps t < levels are loaded, as far as the source
+        file has them. Only the needed prefix of the file is read.
+        """
+        if levels <= self.levels or self.source is None:
+            return
+        if self.source.endswith('.csv'):
+            table = ValueTable.from_csv(self.source, self.encoding, levels)
+        else:
+            table = ValueTable.load(self.source, levels)
+        self.values, self.levels, self.encoding = table.values, table.levels, table.encoding
+        self.scales, self.offsets, self.error = table.scales, table.offsets, table.error
+        # the whole file is loaded
+        if self.levels < levels:
+            self.source = None
+
+## Effect of the encoding on decisions
+
+def _qvalues(valuefunction, state, t, steps_left, scale, cache):
+    """
+    Q-values of the two arms as computed by ValueFunctionLookahead (in lookahead.py);
+    t is the 0-based time step. Returns qvalueA, qvalueB.
+    """
+    def value(state, t, steps_left):
+        if steps_left == 0:
+            return scale * (valuefunction[(t, state[0], state[1])] + valuefunction[(t, state[2], state[3])])
+        # the value of the state with the arms swapped is the same
+        key = min(state, (state[2], state[3], state[0], state[1]))
+        if key not in cache:
+            cache[key] = max(_qvalues(valuefunction, state, t, steps_left, scale, cache))
+        return cache[key]
+
+    vApos = value((state[0]+1, state[1], state[2], state[3]), t+1, steps_left-1)
+    vAneg = value((state[0], state[1]+1, state[2], state[3]), t+1, steps_left-1)
+    vBpos = value((state[0], state[1], state[2]+1, state[3]), t+1, steps_left-1)
+    vBneg = value((state[0], state[1], state[2], state[3]+1), t+1, steps_left-1)
+    pA = state[0] / (state[0] + state[1])
+    pB = state[2] / (state[2] + state[3])
+    return pA * (1 + vApos) + (1 - pA) * vAneg, pB * (1 + vBpos) + (1 - pB) * vBneg
+
+
+def decision_changes(reference, candidate, horizon, lookahead_hor=1, scale=1.0, samples=10000):
+    """
+    Measures how many lookahead decisions change when the candidate table is used
+    instead of the reference table. Belief states are sampled uniformly over the
+    time steps and the splits of the pulls between arms and outcomes.
+
+    The leaf values differ by at most 2 * scale * candidate.error and the expectations
+    and maxima in the lookahead do not increase the difference, so a decision can only
+    change when the reference q-values are within 4 * scale * candidate.error.
+
+    Returns
+    -------
+    out : dict
+        changed : fraction of the sampled decisions that changed
+        bound : fraction of the sampled states whose margin is within the error bound
+        margin : 4 * scale * candidate.error
+    """
+    margin = 4 * scale * candidate.error
+    changed = 0
+    close = 0
+    for _ in range(samples):
+        # the lookahead reads the table up to t + lookahead_hor
+        t = random.randrange(horizon - lookahead_hor + 1)
+        pullsA = random.randint(0, t)
+        posA = random.randint(0, pullsA)
+        posB = random.randint(0, t - pullsA)
+        state = (1 + posA, 1 + pullsA - posA, 1 + posB, 1 + t - pullsA - posB)
+        qA, qB = _qvalues(reference, state, t, lookahead_hor, scale, {})
+        cA, cB = _qvalues(candidate, state, t, lookahead_hor, scale, {})
+        changed += bool((qA > qB) != (cA > cB) or (qA == qB) != (cA == cB))
+        close += bool(abs(qA - qB) <= margin)
+    return {'changed': changed / samples, 'bound': close / samples, 'margin': margin}